@@ -1,25 +1,20 @@
 """Payfort helpers."""
 
 import hashlib
+import hmac
 import re
-from typing import Any, Dict
+from functools import lru_cache
+from operator import itemgetter
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple
 
 from django.conf import settings
+from django.http import QueryDict
 from zeitlabs_payments.helpers import verify_param
 
 from .exceptions import PayFortBadSignatureException, PayFortException
 
-MANDATORY_RESPONSE_FIELDS = [
-    'merchant_reference',
-    'command',
-    'merchant_identifier',
-    'amount',
-    'currency',
-    'response_code',
-    'signature',
-    'status',
-]
 MAX_ORDER_DESCRIPTION_LENGTH = 150
+MERCHANT_REFERENCE_PATTERN = re.compile(r'^(\d+)-(\d+)$')
 SUCCESS_STATUS = '14'
 VALID_PATTERNS = {
     'order_description': r"[^A-Za-z0-9 '/\._\-#:$]",
@@ -31,6 +26,58 @@ SUPPORTED_SHA_METHODS = {
 }
 
 
+class PayFortResponse(NamedTuple):
+    """The mandatory fields of a validated PayFort response."""
+
+    merchant_reference: str
+    command: str
+    merchant_identifier: str
+    amount: str
+    currency: str
+    response_code: str
+    signature: str
+    status: str
+
+
+MANDATORY_RESPONSE_FIELDS = list(PayFortResponse._fields)
+_get_mandatory_response_fields = itemgetter(*PayFortResponse._fields)
+
+
+@lru_cache(maxsize=128)
+def _get_signature_key_order(keys: Tuple[str, ...]) -> Tuple[str, ...]:
+    """
+    Return the parameter names in the order they are concatenated for the signature.
+
+    Only a handful of distinct parameter sets are ever signed, so the order is computed once per set.
+
+    :param keys: The parameter names, in the order they appear in the parameters.
+    :return: The parameter names sorted case-insensitively, names differing only by case kept in their given order.
+    """
+    return tuple(sorted(keys, key=str.lower))
+
+
+def _calculate_signature(
+    sha_phrase: str,
+    sha_method_fnc: Callable[..., Any],
+    transaction_parameters: Dict[str, Any],
+) -> str:
+    """
+    Calculate the signature of already validated parameters.
+
+    :param sha_phrase: The SHA phrase.
+    :param sha_method_fnc: The hashlib constructor of the SHA method.
+    :param transaction_parameters: The transaction parameters.
+    :return: The calculated signature.
+    """
+    encoded_sha_phrase = sha_phrase.encode()
+    buffer = bytearray(encoded_sha_phrase)
+    for key in _get_signature_key_order(tuple(transaction_parameters)):
+        buffer += f'{key}={transaction_parameters[key]}'.encode()
+    buffer += encoded_sha_phrase
+
+    return sha_method_fnc(buffer).hexdigest()
+
+
 def get_signature(sha_phrase: str, sha_method: str, transaction_parameters: Dict[str, Any]) -> str:
     """
     Return the signature for the given transaction parameters.
@@ -49,58 +96,86 @@ def get_signature(sha_phrase: str, sha_method: str, transaction_parameters: Dict
     if sha_method_fnc is None:
         raise PayFortException(f'Unsupported SHA method: {sha_method}')
 
-    sorted_keys = sorted(transaction_parameters, key=lambda arg: arg.lower())
-    sorted_dict = {key: transaction_parameters[key] for key in sorted_keys}
+    return _calculate_signature(sha_phrase, sha_method_fnc, transaction_parameters)
+
+
+def parse_merchant_reference(merchant_reference: str) -> Optional[Tuple[str, str]]:
+    """
+    Split a merchant reference into its site id and cart id.
+
+    :param merchant_reference: The merchant reference, formatted as <site_id>-<cart_id>.
+    :return: A (site_id, cart_id) tuple, or None if the reference is malformed.
+    """
+    match = MERCHANT_REFERENCE_PATTERN.fullmatch(merchant_reference)
+    if match is None:
+        return None
+    site_id, cart_id = match.groups()
+    return site_id, cart_id
+
+
+def get_response_data(query_dict: QueryDict) -> Dict[str, Any]:
+    """
+    Return the response data received from PayFort as a plain dictionary.
 
-    result_string = f"{sha_phrase}{''.join(f'{key}={value}' for key, value in sorted_dict.items())}{sha_phrase}"
+    Same result as ``QueryDict.dict()`` (the last value of each key is kept), but reads the
+    underlying lists in a single pass instead of looking every key up again.
 
-    return sha_method_fnc(result_string.encode()).hexdigest()
+    :param query_dict: The received POST data.
+    :return: The response data dictionary.
+    """
+    return {key: values[-1] if values else [] for key, values in query_dict.lists()}
 
 
-def verify_response_format(response_data: Dict[str, Any]) -> None:
+def verify_response_format(response_data: Dict[str, Any]) -> PayFortResponse:
     """
     Verify the format of the response from PayFort.
 
     :param response_data: The response data dictionary.
+    :return: The mandatory fields of the response.
     :raises PayFortException: If any validation fails.
     """
-    for field in MANDATORY_RESPONSE_FIELDS:
-        if field not in response_data:
-            raise PayFortException(f'Missing field in response: {field}')
-        if not isinstance(response_data[field], str):
+    try:
+        response = PayFortResponse._make(_get_mandatory_response_fields(response_data))
+    except KeyError as exc:
+        raise PayFortException(f'Missing field in response: {exc.args[0]}') from exc
+
+    for field, value in zip(PayFortResponse._fields, response):
+        if not isinstance(value, str):
             raise PayFortException(
                 f'Invalid field type in response: {field}. '
-                f'Should be <str>, but got <{type(response_data[field]).__name__}>'
+                f'Should be <str>, but got <{type(value).__name__}>'
             )
 
     try:
-        amount = int(response_data['amount'])
-        if amount < 0 or response_data['amount'] != str(amount):
+        amount = int(response.amount)
+        if amount < 0 or response.amount != str(amount):
             raise ValueError
     except ValueError as exc:
         raise PayFortException(
-            f'Invalid amount in response (not a positive integer): {response_data["amount"]}'
+            f'Invalid amount in response (not a positive integer): {response.amount}'
         ) from exc
 
-    if response_data['currency'] != settings.VALID_CURRENCY:
-        raise PayFortException(f'Invalid currency in response: {response_data["currency"]}')
+    if response.currency != settings.VALID_CURRENCY:
+        raise PayFortException(f'Invalid currency in response: {response.currency}')
 
-    if response_data['command'] != 'PURCHASE':
-        raise PayFortException(f'Invalid command in response: {response_data["command"]}')
+    if response.command != 'PURCHASE':
+        raise PayFortException(f'Invalid command in response: {response.command}')
 
-    if re.fullmatch(r'^\d+-\d+$', response_data['merchant_reference']) is None:
+    if MERCHANT_REFERENCE_PATTERN.fullmatch(response.merchant_reference) is None:
         raise PayFortException(
-            f'Invalid merchant_reference in response: {response_data["merchant_reference"]}'
+            f'Invalid merchant_reference in response: {response.merchant_reference}'
         )
 
     if (
         (response_data.get('eci') is None or response_data.get('fort_id') is None) and
-        response_data['status'] == SUCCESS_STATUS
+        response.status == SUCCESS_STATUS
     ):
         raise PayFortException(
-            f'Unexpected successful payment that lacks eci or fort_id: {response_data["merchant_reference"]}'
+            f'Unexpected successful payment that lacks eci or fort_id: {response.merchant_reference}'
         )
 
+    return response
+
 
 def verify_signature(sha_phrase: str, sha_method: str, data: Dict[str, Any]) -> None:
     """
@@ -123,12 +198,9 @@ def verify_signature(sha_phrase: str, sha_method: str, data: Dict[str, Any]) ->
     if signature is None:
         raise PayFortBadSignatureException('Signature not found!')
 
-    expected_signature = get_signature(
-        sha_phrase,
-        sha_method,
-        data,
-    )
-    if signature != expected_signature:
+    verify_param(sha_phrase, 'sha_phrase', str)
+    expected_signature = _calculate_signature(sha_phrase, sha_method_fnc, data)
+    if not hmac.compare_digest(str(signature).encode(), expected_signature.encode()):
         raise PayFortBadSignatureException(
             f'Response signature mismatch. merchant_reference: {data.get("merchant_reference", "none")}'
         )
@@ -1,6 +1,7 @@
 """Payfort processor."""
 
 import logging
+from functools import cached_property
 from typing import Any, Dict, Optional
 from urllib.parse import urljoin
 
@@ -37,7 +38,16 @@ class PayFort(BaseProcessor):
         self.response_sha_phrase = settings.PAYFORT_SETTINGS['response_sha_phrase']
         self.sha_method = settings.PAYFORT_SETTINGS['sha_method']
         self.redirect_url = settings.PAYFORT_SETTINGS['redirect_url']
-        self.return_url = urljoin(
+
+    @cached_property
+    def return_url(self) -> str:
+        """
+        Return the absolute URL PayFort redirects the user back to.
+
+        Resolved on first use rather than in __init__, so building the processor does not go through the site
+        configuration lookup unless a payment form is actually rendered.
+        """
+        return urljoin(
             configuration_helpers.get_value('LMS_ROOT_URL', settings.ECOMMERCE_PUBLIC_URL_ROOT),
             reverse('payfort:return')
         )
@@ -11,3 +11,10 @@ def plugin_settings(settings: Any) -> None:
         'PAYFORT_SETTINGS',
         {},
     )
+    # Acknowledge non-successful feedback without verifying its signature. This skips the signature
+    # check for responses that change nothing, at the cost of no longer auditing forged failure notifications.
+    settings.PAYFORT_FAST_FAIL_UNVERIFIED = getattr(
+        settings,
+        'PAYFORT_FAST_FAIL_UNVERIFIED',
+        False,
+    )
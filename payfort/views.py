@@ -1,9 +1,12 @@
 """Payfort Views."""
 import logging
+from functools import cached_property
 from typing import Any
 
+from django.conf import settings
 from django.contrib.sites.models import Site
 from django.db import transaction
+from django.db.models import OuterRef, Subquery
 from django.http import HttpResponse, JsonResponse
 from django.shortcuts import render
 from django.urls import reverse
@@ -15,7 +18,13 @@ from zeitlabs_payments.exceptions import DuplicateTransactionError, GatewayError
 from zeitlabs_payments.models import AuditLog, Cart, Invoice
 
 from .exceptions import PayFortBadSignatureException, PayFortException
-from .helpers import SUCCESS_STATUS, verify_response_format, verify_signature
+from .helpers import (
+    SUCCESS_STATUS,
+    get_response_data,
+    parse_merchant_reference,
+    verify_response_format,
+    verify_signature,
+)
 from .processor import PayFort
 
 logger = logging.getLogger(__name__)
@@ -24,44 +33,70 @@ logger = logging.getLogger(__name__)
 class PayFortBaseView(View):
     """Payfort Base View."""
 
-    @property
+    @cached_property
     def payment_processor(self) -> PayFort:
         """Return processor."""
         return PayFort()
 
-    @property
+    @cached_property
+    def _merchant_reference(self) -> str | None:
+        """Return the merchant_reference posted in the request, if any."""
+        if not self.request:
+            return None
+        return self.request.POST.get('merchant_reference') or None
+
+    @cached_property
+    def _reference_parts(self) -> tuple[str, str] | None:
+        """
+        Split the merchant_reference of the request into its site id and cart id.
+
+        :return: A (site_id, cart_id) tuple, or None if merchant_reference is missing or malformed.
+        """
+        if not self._merchant_reference:
+            return None
+        return parse_merchant_reference(self._merchant_reference)
+
+    @cached_property
     def cart(self) -> Cart | None:
         """Retrieve the cart from the database."""
-        if not self.request or not self.request.POST.get('merchant_reference'):
+        if not self._merchant_reference:
             return None
 
-        reference = self.request.POST.get('merchant_reference')
-        try:
-            _, cart_id = reference.split('-', 1)
-            return self.payment_processor.get_cart(cart_id)
-        except (ValueError, InvalidCartError):
-            AuditLog.log(
-                action=AuditLog.AuditActions.RESPONSE_INVALID_CART,
-                cart=None,
-                gateway=self.payment_processor.SLUG,
-                context={'cart_status': 'None', 'required_cart_state': Cart.Status.PROCESSING}
-            )
-            logger.error(f'Payfort Error! merchant_reference: {reference} is invalid. Unable to get cart.')
-            return None
+        if self._reference_parts is not None:
+            _, cart_id = self._reference_parts
+            try:
+                return self.payment_processor.get_cart(cart_id)
+            except InvalidCartError:
+                pass
+
+        AuditLog.log(
+            action=AuditLog.AuditActions.RESPONSE_INVALID_CART,
+            cart=None,
+            gateway=self.payment_processor.SLUG,
+            context={'cart_status': 'None', 'required_cart_state': Cart.Status.PROCESSING}
+        )
+        logger.error(
+            'Payfort Error! merchant_reference: %s is invalid. Unable to get cart.', self._merchant_reference
+        )
+        return None
 
-    @property
+    @cached_property
     def site(self) -> Site | None:
         """Retrieve the site from the database."""
-        if not self.request or not self.request.POST.get('merchant_reference'):
+        if not self._merchant_reference:
             return None
 
-        reference = self.request.POST.get('merchant_reference')
-        try:
-            site_id, _ = reference.split('-', 1)
-            return self.payment_processor.get_site(site_id)
-        except (ValueError, GatewayError):
-            logger.error(f'Payfort Error! merchant_reference: {reference} is invalid. Unable to extract site.')
-            return None
+        if self._reference_parts is not None:
+            site_id, _ = self._reference_parts
+            try:
+                return self.payment_processor.get_site(site_id)
+            except GatewayError:
+                pass
+
+        logger.error(
+            'Payfort Error! merchant_reference: %s is invalid. Unable to extract site.', self._merchant_reference
+        )
+        return None
 
     @method_decorator(csrf_exempt)
     def dispatch(self, request: Any, *args: Any, **kwargs: Any) -> Any:
@@ -80,7 +115,7 @@ class PayFortReturnView(PayFortBaseView):
 
     def post(self, request: Any) -> HttpResponse:
         """Handle the POST request from PayFort after processing payment page."""
-        data = request.POST.dict()
+        data = get_response_data(request.POST)
         try:
             verify_signature(
                 self.payment_processor.response_sha_phrase,
@@ -101,7 +136,7 @@ class PayFortReturnView(PayFortBaseView):
             try:
                 verify_response_format(data)
             except PayFortException as exc:
-                logger.error(f'Payfort response validation failed: {str(exc)}')
+                logger.error('Payfort response validation failed: %s', exc)
                 return render(request, 'zeitlabs_payments/payment_error.html')
 
             data['ecommerce_transaction_id'] = data['fort_id']
@@ -119,8 +154,10 @@ class PayFortReturnView(PayFortBaseView):
             return render(request=request, template_name=self.template_name, context=data)
 
         logger.error(
-            f"Payfort payment failed! with merchant_reference: {data.get('merchant_reference')}, status:"
-            f" {data.get('status')} and response_code: {data.get('response_code')}"
+            'Payfort payment failed! with merchant_reference: %s, status: %s and response_code: %s',
+            data.get('merchant_reference'),
+            data.get('status'),
+            data.get('response_code'),
         )
         return render(request, 'zeitlabs_payments/payment_error.html')
 
@@ -132,7 +169,7 @@ class PayfortFeedbackView(PayFortBaseView):
 
     def post(self, request: Any) -> HttpResponse:
         """Handle the POST request from PayFort for payment status or feedback."""
-        data = request.POST.dict()
+        data = get_response_data(request.POST)
         AuditLog.log(
             action=AuditLog.AuditActions.RECEIVED_RESPONSE,
             cart=self.cart,
@@ -140,6 +177,10 @@ class PayfortFeedbackView(PayFortBaseView):
             context={'data': data}
         )
 
+        if getattr(settings, 'PAYFORT_FAST_FAIL_UNVERIFIED', False) and data.get('status') != SUCCESS_STATUS:
+            logger.warning('PayFort payment unsuccessful. Status: %s, Data: %s', data.get('status'), data)
+            return HttpResponse(status=200)
+
         if not self.cart or not self.site:
             logger.warning(
                 'PayFort response can not be processed further, unable to retrieve '
@@ -164,32 +205,35 @@ class PayfortFeedbackView(PayFortBaseView):
             return HttpResponse(status=400)
 
         if data.get('status') != SUCCESS_STATUS:
-            logger.warning(f"PayFort payment unsuccessful. Status: {data.get('status')}, Data: {data}")
+            logger.warning('PayFort payment unsuccessful. Status: %s, Data: %s', data.get('status'), data)
             return HttpResponse(status=200)
 
-        verify_response_format(data)
-
-        if self.cart.status != Cart.Status.PROCESSING:
-            AuditLog.log(
-                action=AuditLog.AuditActions.RESPONSE_INVALID_CART,
-                cart=self.cart,
-                gateway=self.payment_processor.SLUG,
-                context={'cart_status': self.cart.status, 'required_cart_state': Cart.Status.PROCESSING}
-            )
-            logger.warning(f'Cart {self.cart.id} in invalid status: {self.cart.status} (expected: PROCESSING).')
-            return HttpResponse(status=200)
+        payfort_response = verify_response_format(data)
 
         try:
             with transaction.atomic():
-                logger.info(f'Recording payment transaction for cart {self.cart.id}.')
+                self.cart = Cart.objects.select_for_update().get(pk=self.cart.pk)
+                if self.cart.status != Cart.Status.PROCESSING:
+                    AuditLog.log(
+                        action=AuditLog.AuditActions.RESPONSE_INVALID_CART,
+                        cart=self.cart,
+                        gateway=self.payment_processor.SLUG,
+                        context={'cart_status': self.cart.status, 'required_cart_state': Cart.Status.PROCESSING}
+                    )
+                    logger.warning(
+                        'Cart %s in invalid status: %s (expected: PROCESSING).', self.cart.id, self.cart.status
+                    )
+                    return HttpResponse(status=200)
+
+                logger.info('Recording payment transaction for cart %s.', self.cart.id)
                 transaction_record = self.payment_processor.handle_payment(
                     cart=self.cart,
                     user=request.user if request.user.is_authenticated else None,
                     transaction_status=data['response_message'],
                     transaction_id=data['fort_id'],
                     method=data['payment_option'],
-                    amount=data['amount'],
-                    currency=data['currency'],
+                    amount=payfort_response.amount,
+                    currency=payfort_response.currency,
                     reason=data['acquirer_response_message'],
                     response=data
                 )
@@ -215,11 +259,11 @@ class PayfortFeedbackView(PayFortBaseView):
                     'site_id': self.site.id
                 }
             )
-            logger.error(f'Payment transaction failed and rolled back for cart {self.cart.id}: {str(e)}')
+            logger.error('Payment transaction failed and rolled back for cart %s: %s', self.cart.id, e)
             return HttpResponse(status=200)
 
         try:
-            self.cart.refresh_from_db()
+            self.cart.refresh_from_db(fields=['status'])
             invoice = self.payment_processor.create_invoice(self.cart, request, transaction_record)
             self.payment_processor.fulfill_cart(self.cart)
             AuditLog.log(
@@ -228,9 +272,9 @@ class PayfortFeedbackView(PayFortBaseView):
                 gateway=self.payment_processor.SLUG,
                 context={}
             )
-            logger.info(f'Successfully fulfilled cart {self.cart.id} and created invoice {invoice.id}.')
+            logger.info('Successfully fulfilled cart %s and created invoice %s.', self.cart.id, invoice.id)
         except Exception as e:  # pylint: disable=broad-exception-caught
-            logger.error(f'Failed to fulfill cart {self.cart.id} or to create invoice: {str(e)}')
+            logger.error('Failed to fulfill cart %s or to create invoice: %s', self.cart.id, e)
         return HttpResponse(status=200)
 
 
@@ -248,16 +292,29 @@ class PayFortStatusView(PayFortBaseView):
         missing_fields = [key for key, value in params.items() if not value]
         if missing_fields:
             field_names = ', '.join(missing_fields).replace('_', ' ').title()
-            logger.error(f'Payfort Error! {field_names} is required to verify payment status.')
+            logger.error('Payfort Error! %s is required to verify payment status.', field_names)
             return JsonResponse(
                 data={'error': f'{field_names} is required to verify payment status.'},
                 status=400
             )
 
-        try:
-            _, cart_id = params['merchant_reference'].split('-', 1)
-            cart = PayFort().get_cart(cart_id)
-        except (ValueError, InvalidCartError):
+        reference_parts = parse_merchant_reference(params['merchant_reference'])
+        cart = None
+        if reference_parts is not None:
+            _, cart_id = reference_parts
+            # The cart is only read here, so it is fetched with its paid invoice number in one query instead of
+            # through payment_processor.get_cart(); an unknown cart is reported the same way as an InvalidCartError.
+            cart = Cart.objects.annotate(
+                paid_invoice_number=Subquery(
+                    Invoice.objects.filter(
+                        cart=OuterRef('pk'),
+                        status=Invoice.InvoiceStatus.PAID,
+                        related_transaction__gateway_transaction_id=params['transaction_id'],
+                    ).values('invoice_number')[:1]
+                )
+            ).filter(pk=cart_id).first()
+
+        if cart is None:
             AuditLog.log(
                 action=AuditLog.AuditActions.RESPONSE_INVALID_CART,
                 cart=None,
@@ -275,17 +332,13 @@ class PayFortStatusView(PayFortBaseView):
         }.get(cart.status, 404)
 
         if status_code == 200:
-            invoice = Invoice.objects.filter(
-                cart=cart,
-                status=Invoice.InvoiceStatus.PAID,
-                related_transaction__gateway_transaction_id=params['transaction_id']).first()
-            if invoice:
+            if cart.paid_invoice_number:
                 return JsonResponse(
                     {
-                        'invoice': invoice.invoice_number,
+                        'invoice': cart.paid_invoice_number,
                         'invoice_url': reverse(
                             'zeitlabs_payments:invoice',
-                            args=[invoice.invoice_number]
+                            args=[cart.paid_invoice_number]
                         )
                     }, status=200)
 
@@ -63,6 +63,9 @@ TEMPLATES = [{
     },
 }]
 
+# Users created by the tests don't need a slow password hash
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
 # Avoid warnings about migrations
 DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
 
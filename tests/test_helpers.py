@@ -4,10 +4,18 @@ from typing import Dict
 
 import pytest
 from django.contrib.auth import get_user_model
+from django.http import QueryDict
 from zeitlabs_payments.exceptions import GatewayError
 
 from payfort.exceptions import PayFortBadSignatureException, PayFortException
-from payfort.helpers import get_signature, verify_response_format, verify_signature
+from payfort.helpers import (
+    MANDATORY_RESPONSE_FIELDS,
+    get_response_data,
+    get_signature,
+    parse_merchant_reference,
+    verify_response_format,
+    verify_signature,
+)
 
 User = get_user_model()
 VALID_RESPONSE: Dict[str, str] = {
@@ -52,6 +60,19 @@ def test_get_signature_valid(sha_phrase, sha_method, params, expected_hash_start
     assert signature == expected_hash_start, f'failed for usecase: {usecase}'
 
 
+@pytest.mark.parametrize('params, expected_string', [
+    ({'b': '1', 'B': '2', 'a': '3'}, 'a=3b=1B=2'),
+    ({'B': '2', 'b': '1', 'a': '3'}, 'a=3B=2b=1'),
+])
+def test_get_signature_keeps_order_of_case_only_ties(params, expected_string):
+    """
+    Test that get_signature sorts parameter names case-insensitively, keeping the given order of names that only
+    differ by case.
+    """
+    expected_signature = hashlib.sha256(f'secret{expected_string}secret'.encode()).hexdigest()
+    assert get_signature('secret', 'SHA-256', params) == expected_signature
+
+
 @pytest.mark.parametrize(
     'sha_phrase, sha_method, params, expected_error, usecase',
     [
@@ -72,6 +93,31 @@ def test_get_signature_invalid(sha_phrase, sha_method, params, expected_error, u
     assert expected_error in str(exc_info.value), f'Failed for case: {usecase}.'
 
 
+@pytest.mark.parametrize('merchant_reference, expected_result', [
+    ('12-345', ('12', '345')),
+    ('12-', None),
+    ('-345', None),
+    ('12-345-6', None),
+    ('bad-format', None),
+    ('12345', None),
+])
+def test_parse_merchant_reference(merchant_reference, expected_result):
+    """
+    Test that parse_merchant_reference splits well-formed references and returns None for malformed ones.
+    """
+    assert parse_merchant_reference(merchant_reference) == expected_result
+
+
+def test_get_response_data():
+    """
+    Test that get_response_data flattens the POST data like QueryDict.dict(), keeping the last value of each key.
+    """
+    query_dict = QueryDict('status=14&amount=100&amount=150&signature=abcd')
+    result = get_response_data(query_dict)
+    assert result == {'status': '14', 'amount': '150', 'signature': 'abcd'}
+    assert result == query_dict.dict()
+
+
 @pytest.mark.parametrize('modified_response, expected_error, usecase', [
     (
         VALID_RESPONSE, None,
@@ -124,7 +170,10 @@ def test_verify_response_format(modified_response, expected_error, usecase):
             verify_response_format(modified_response)
         assert expected_error in str(exc_info.value), f'Failed case: {usecase}'
     else:
-        verify_response_format(modified_response)  # Should not raise
+        response = verify_response_format(modified_response)
+        assert response._asdict() == {field: modified_response[field] for field in MANDATORY_RESPONSE_FIELDS}
+        assert response.amount == modified_response['amount']
+        assert response.currency == modified_response['currency']
 
 
 @pytest.mark.parametrize(
@@ -12,21 +12,46 @@ from payfort.processor import PayFort
 
 User = get_user_model()
 
+TRANSACTION_PARAMETER_KEYS = frozenset({
+    'command', 'access_code', 'merchant_identifier', 'merchant_reference', 'customer_email', 'return_url',
+    'language', 'amount', 'currency',
+})
+
+
+def get_expected_signature(sha_phrase, params):
+    """Return the SHA-256 signature of the given parameters, built the way PayFort documents it."""
+    parameters_string = ''.join(f'{key}={params[key]}' for key in sorted(params, key=str.lower))
+    return hashlib.sha256(f'{sha_phrase}{parameters_string}{sha_phrase}'.encode()).hexdigest()
+
+
+@pytest.fixture(scope='session')
+def example_site(django_db_setup, django_db_blocker):  # pylint: disable=unused-argument
+    """example.com site fixture, looked up once per session"""
+    with django_db_blocker.unblock():
+        return Site.objects.get(domain='example.com')
+
+
+@pytest.fixture(scope='session')
+def test_user(django_db_setup, django_db_blocker):  # pylint: disable=unused-argument
+    """user fixture, looked up once per session"""
+    with django_db_blocker.unblock():
+        return User.objects.get(id=3)
+
 
 @pytest.fixture
-def fake_request():
+def fake_request(example_site):  # pylint: disable=redefined-outer-name
     """mock request fixture"""
     request = MagicMock(spec=HttpRequest)
     request.build_absolute_uri.return_value = 'https://example.com'
-    request.site = Site.objects.get(domain='example.com')
+    request.site = example_site
     return request
 
 
 @pytest.fixture
-def cart():
+def cart(test_user):  # pylint: disable=redefined-outer-name
     """mock cart fixture"""
     item = CatalogueItem.objects.get(sku='custom-sku-1')
-    user_cart = Cart.objects.create(user=User.objects.get(id=3), status=Cart.Status.PROCESSING)
+    user_cart = Cart.objects.create(user=test_user, status=Cart.Status.PROCESSING)
     user_cart.items.create(
         catalogue_item=item,
         original_price=item.price,
@@ -46,6 +71,8 @@ class TestPayFortProcessor:
         mock_reverse.return_value = '/payfort/return/'
         mock_get_value.return_value = 'https://lms.example.com'
         processor = PayFort()
+        mock_reverse.assert_not_called()
+        mock_get_value.assert_not_called()
         assert processor.access_code == 'test-code'
         assert processor.merchant_identifier == 'test-identifier'
         assert processor.request_sha_phrase == 'test-request-phrase'
@@ -53,6 +80,9 @@ class TestPayFortProcessor:
         assert processor.sha_method == 'SHA-256'
         assert processor.redirect_url == 'https://fake_payfort.com'
         assert processor.return_url == 'https://lms.example.com/payfort/return/'
+        assert processor.return_url == 'https://lms.example.com/payfort/return/'
+        mock_reverse.assert_called_once_with('payfort:return')
+        mock_get_value.assert_called_once()
 
     def test_get_payment_method_metadata_returns_expected(self, cart):  # pylint: disable=redefined-outer-name
         """Test get_payment_method_metadata returns correct dict with slug, title, checkout_text, and URL."""
@@ -74,15 +104,17 @@ class TestPayFortProcessor:
 
         result = processor.get_transaction_parameters_base(cart, fake_request)
 
-        assert result['command'] == 'PURCHASE'
-        assert result['access_code'] == 'AC123'
-        assert result['merchant_identifier'] == 'MID456'
-        assert result['merchant_reference'] == f'{cart.id}-{fake_request.site.id}'
-        assert result['customer_email'] == 'user3@example.com'
-        assert result['return_url'] == 'https://return.url'
-        assert result['language'] == 'en'
-        assert result['amount'] == 5000
-        assert result['currency'] == cart.items.all()[0].catalogue_item.currency
+        assert {
+            'command': 'PURCHASE',
+            'access_code': 'AC123',
+            'merchant_identifier': 'MID456',
+            'merchant_reference': f'{cart.id}-{fake_request.site.id}',
+            'customer_email': 'user3@example.com',
+            'return_url': 'https://return.url',
+            'language': 'en',
+            'amount': 5000,
+            'currency': cart.items.all()[0].catalogue_item.currency,
+        }.items() <= result.items()
         assert 'order_reference' not in result
         assert 'user_email' not in result
 
@@ -93,14 +125,8 @@ class TestPayFortProcessor:
         processor.sha_method = 'SHA-256'
         params = {'foo': 'bar'}
 
-        params_copy = params.copy()
-        sorted_keys = sorted(params_copy, key=lambda arg: arg.lower())
-        sorted_dict = {key: params_copy[key] for key in sorted_keys}
-        result_string = f"abcd11{''.join(f'{key}={value}' for key, value in sorted_dict.items())}abcd11"
-        expected_signature = hashlib.sha256(result_string.encode()).hexdigest()
-
         generated_signature = processor.generate_signature(params)
-        assert generated_signature == expected_signature
+        assert generated_signature == get_expected_signature('abcd11', params)
 
     def test_generate_signature_uses_custom_sha_phrase(self):
         """Test generate_signature calls get_signature with default sha_phrase if none provided."""
@@ -109,14 +135,8 @@ class TestPayFortProcessor:
         processor.sha_method = 'SHA-256'
         params = {'foo': 'bar'}
 
-        params_copy = params.copy()
-        sorted_keys = sorted(params_copy, key=lambda arg: arg.lower())
-        sorted_dict = {key: params_copy[key] for key in sorted_keys}
-        result_string = f"xyz1234{''.join(f'{key}={value}' for key, value in sorted_dict.items())}xyz1234"
-        expected_Signature = hashlib.sha256(result_string.encode()).hexdigest()
-
         generated_signature = processor.generate_signature(params, 'xyz1234')
-        assert generated_signature == expected_Signature
+        assert generated_signature == get_expected_signature('xyz1234', params)
 
     @patch('payfort.processor.get_token')
     @patch.object(PayFort, 'generate_signature')
@@ -130,15 +150,10 @@ class TestPayFortProcessor:
         """Test get_transaction_parameters returns parameters including signature, payment URL, and CSRF token."""
         mock_generate_signature.return_value = 'signature123'
         mock_get_token.return_value = 'csrf1234'
-        keys_to_check = [
-            'command', 'access_code', 'merchant_identifier', 'merchant_reference', 'customer_email', 'return_url',
-            'language', 'amount', 'currency'
-        ]
         processor = PayFort()
         processor.redirect_url = 'https://redirect.url'
         result = processor.get_transaction_parameters(cart, fake_request)
         assert result['signature'] == 'signature123'
         assert result['payment_page_url'] == 'https://redirect.url'
         assert result['csrfmiddlewaretoken'] == 'csrf1234'
-        for key in keys_to_check:
-            assert key in result
+        assert TRANSACTION_PARAMETER_KEYS <= result.keys()
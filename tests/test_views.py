@@ -1,38 +1,94 @@
 """Test views for the zeitlabs_payment payfort provider"""
 import hashlib
-from unittest.mock import patch
+from unittest.mock import patch, sentinel
 
 import pytest
 from common.djangoapps.course_modes.models import CourseMode
 from common.djangoapps.student.models import CourseEnrollment
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.sites.models import Site
-from django.test import Client, RequestFactory, TestCase
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework.test import APITestCase
 from zeitlabs_payments.models import AuditLog, Cart, CatalogueItem, Invoice, Transaction, WebhookEvent
 
+from payfort.helpers import verify_signature
+from payfort.processor import PayFort
 from payfort.views import PayFortBaseView, PayfortFeedbackView
 
 User = get_user_model()
 
 
+def make_cart(user, *catalogue_items):
+    """Return a new PROCESSING cart for the given user, holding the given catalogue items at their full price."""
+    cart = Cart.objects.create(user=user, status=Cart.Status.PROCESSING)
+    for catalogue_item in catalogue_items:
+        cart.items.create(
+            catalogue_item=catalogue_item,
+            original_price=catalogue_item.price,
+            final_price=catalogue_item.price,
+        )
+    return cart
+
+
+def sign_response(data, sha_phrase='test-response-phrase'):
+    """Return a copy of the given response data with the SHA-256 signature PayFort would send added."""
+    parameters_string = ''.join(f'{key}={data[key]}' for key in sorted(data, key=str.lower))
+    signature = hashlib.sha256(f'{sha_phrase}{parameters_string}{sha_phrase}'.encode()).hexdigest()
+    return {**data, 'signature': signature}
+
+
+def get_logged_message(mock_log_method):
+    """Return the last message logged through the given mocked logger method, with its arguments applied."""
+    message, *args = mock_log_method.call_args.args
+    return message % tuple(args)
+
+
+class TestPayFortBaseView:
+    """PayfortBaseView tests with the processor lookups mocked."""
+
+    factory = RequestFactory()
+
+    def test_cart_and_site_are_retrieved_once(self):
+        view = PayFortBaseView()
+        view.request = self.factory.post('/fake-url/', data={'merchant_reference': '5-7'})
+
+        with patch.object(PayFort, 'get_cart', return_value=sentinel.cart) as mock_get_cart, \
+                patch.object(PayFort, 'get_site', return_value=sentinel.site) as mock_get_site:
+            assert view.cart is view.cart is sentinel.cart
+            assert view.site is view.site is sentinel.site
+
+        mock_get_cart.assert_called_once_with('7')
+        mock_get_site.assert_called_once_with('5')
+
+
 @pytest.mark.django_db
 class TestPayFortBaseViewNoMocks:
     """PayfortBaseView tests."""
 
     factory = RequestFactory()
-    view = PayFortBaseView()
+    view = None
     site = None
     cart = None
 
+    @pytest.fixture(scope='class', autouse=True)
+    def shared_site(self, request, django_db_setup, django_db_blocker):  # pylint: disable=unused-argument
+        """Create the site shared by all the tests of the class, and delete it once they are done if it was created."""
+        with django_db_blocker.unblock():
+            request.cls.site, created = Site.objects.get_or_create(domain='testsite.com', defaults={'name': 'TestSite'})
+        yield
+        if created:
+            with django_db_blocker.unblock():
+                request.cls.site.delete()
+
     def setup_method(self):
         """setup"""
-        self.site = Site.objects.create(name='TestSite', domain='testsite.com')
-        self.cart = Cart.objects.create(
-            user=User.objects.get(id=3),
-            status=Cart.Status.PROCESSING
-        )
+        self.view = PayFortBaseView()
+        self.cart = Cart.objects.create(user_id=3, status=Cart.Status.PROCESSING)
 
     def test_cart_and_site_return_real_objects(self):
         merchant_ref = f'{self.site.id}-{self.cart.id}'
@@ -47,110 +103,113 @@ class TestPayFortBaseViewNoMocks:
         assert cart.id == self.cart.id
         assert site.id == self.site.id
 
-    def test_cart_returns_none_on_bad_reference(self):
-        request = self.factory.post('/fake-url/', data={'merchant_reference': 'bad-format'})
-        self.view.request = request
-        assert self.view.cart is None
-
-    def test_site_returns_none_on_bad_reference(self):
-        request = self.factory.post('/fake-url/', data={'merchant_reference': 'bad-format'})
-        self.view.request = request
-        assert self.view.site is None
-
-    def test_cart_returns_none_if_merchant_reference_missing(self):
-        request = self.factory.post('/fake-url/', data={})
-        self.view.request = request
-        assert self.view.cart is None
-
-    def test_site_returns_none_if_merchant_reference_missing(self):
-        request = self.factory.post('/fake-url/', data={})
-        self.view.request = request
-        assert self.view.site is None
-
-    def test_cart_returns_none_if_request_missing(self):
-        self.view.request = None
-        assert self.view.cart is None
-
-    def test_site_returns_none_if_request_missing(self):
-        self.view.request = None
-        assert self.view.site is None
+    @pytest.mark.parametrize('attribute', ['cart', 'site'])
+    @pytest.mark.parametrize('data', [
+        {'merchant_reference': 'bad-format'},
+        {},
+        None,
+    ], ids=['bad_reference', 'merchant_reference_missing', 'request_missing'])
+    def test_returns_none_for_invalid_input(self, attribute, data):
+        self.view.request = None if data is None else self.factory.post('/fake-url/', data=data)
+        assert getattr(self.view, attribute) is None
 
 
 @pytest.mark.usefixtures('base_data')
 class PayfortFeedbackTestView(TestCase):
     """Payfort feedback test case."""
 
+    request_factory = RequestFactory()
+
+    VALID_RESPONSE = {
+        'amount': '150',
+        'response_code': '14000',
+        'acquirer_response_message': 'Success',
+        'card_number': '411111******1111',
+        'card_holder_name': 'Tehreem',
+        'signature': '141ae3d36be4f7f50cefbb966b26c8ee073a84dd32d99eec3084d19efb247895',
+        'merchant_identifier': 'abcdi',
+        'access_code': 'm6ScifP9737ykbx31Z7i',
+        'order_description': 'some order description',
+        'payment_option': 'VISA',
+        'expiry_date': '2511',
+        'customer_ip': '101.53.219.17',
+        'language': 'en',
+        'eci': 'ECOMMERCE',
+        'fort_id': '169996200024611493',
+        'command': 'PURCHASE',
+        'response_message': 'Success',
+        'authorization_code': '742138',
+        'customer_email': 'tehreemsadat19@gmail.com',
+        'currency': 'SAR',
+        'acquirer_response_code': '00',
+        'status': '14',
+    }
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """
+        Set up the data shared by all the Payfort feedback tests.
+
+        :return: None
+        """
+        cls.user = User.objects.get(id=3)
+        cls.course_mode = CourseMode.objects.get(sku='custom-sku-1')
+        cls.course_item = CatalogueItem.objects.get(sku='custom-sku-1')
+        cls.site, _ = Site.objects.get_or_create(domain='test.com', defaults={'name': 'test.com'})
+        cls.provider = 'payfort'
+        cls.url = reverse('payfort:return')
+        cls.cart = make_cart(cls.user, cls.course_item)
+        cls.merchant_reference = f'{cls.site.id}-{cls.cart.id}'
+
     def setUp(self) -> None:
         """
-        Set up test data for the Payfort feedback tests.
+        Bypass the response signature check, which only test_post_for_invalid_signature exercises.
 
         :return: None
         """
-        self.user = User.objects.get(id=3)
-        self.cart = Cart.objects.create(user=self.user, status=Cart.Status.PROCESSING)
-        self.course_mode = CourseMode.objects.get(sku='custom-sku-1')
-        self.course_item = CatalogueItem.objects.get(sku='custom-sku-1')
-        self.cart.items.create(
-            catalogue_item=self.course_item,
-            original_price=self.course_item.price,
-            final_price=self.course_item.price,
-        )
-        self.site = Site.objects.create(name='test.com', domain='test.com')
-        self.provider = 'payfort'
-        self.url = reverse('payfort:return')
+        patcher = patch('payfort.views.verify_signature')
+        self.mock_verify_signature = patcher.start()
+        self.addCleanup(patcher.stop)
 
-        self.valid_response = {
-            'amount': '150',
-            'response_code': '14000',
-            'acquirer_response_message': 'Success',
-            'card_number': '411111******1111',
-            'card_holder_name': 'Tehreem',
-            'signature': '141ae3d36be4f7f50cefbb966b26c8ee073a84dd32d99eec3084d19efb247895',
-            'merchant_identifier': 'abcdi',
-            'access_code': 'm6ScifP9737ykbx31Z7i',
-            'order_description': 'some order description',
-            'payment_option': 'VISA',
-            'expiry_date': '2511',
-            'customer_ip': '101.53.219.17',
-            'language': 'en',
-            'eci': 'ECOMMERCE',
-            'fort_id': '169996200024611493',
-            'command': 'PURCHASE',
-            'response_message': 'Success',
-            'merchant_reference': f'{self.site.id}-{self.cart.id}',
-            'authorization_code': '742138',
-            'customer_email': 'tehreemsadat19@gmail.com',
-            'currency': 'SAR',
-            'acquirer_response_code': '00',
-            'status': '14',
-        }
-        self.request_factory = RequestFactory()
+    @property
+    def valid_response(self) -> dict:
+        """
+        Return a successful PayFort response for the test cart.
 
-    def test_post_for_invalid_cart_in_merchant_ref(self) -> None:
+        :return: The response data.
         """
-        Test that posting with an invalid cart ID in merchant_reference raises PayFortException.
+        return {**self.VALID_RESPONSE, 'merchant_reference': self.merchant_reference}
 
-        :return: None
+    def post_feedback(self, data: dict) -> HttpResponse:
+        """
+        Post the given data to the feedback view as the test user.
+
+        :param data: The response data PayFort would post.
+        :return: The view's response.
         """
-        data = self.valid_response.copy()
-        data.update({'merchant_reference': '1-10000'})
         request = self.request_factory.post(self.url, data)
         request.user = self.user
-        response = PayfortFeedbackView.as_view()(request)
-        assert response.status_code == 400
+        return PayfortFeedbackView.as_view()(request)
 
-    def test_post_for_invalid_site_in_merchant_ref(self) -> None:
+    def payfort_transaction_count(self) -> int:
         """
-        Test that posting with an invalid site ID in merchant_reference raises PayFortException.
+        Return the number of PayFort transactions recorded for the test cart.
+
+        :return: The transaction count.
+        """
+        return Transaction.objects.filter(gateway='payfort', cart=self.cart).count()
+
+    def test_post_for_invalid_merchant_ref(self) -> None:
+        """
+        Test that posting with an unknown cart or site ID in merchant_reference is rejected.
 
         :return: None
         """
-        data = self.valid_response.copy()
-        data.update({'merchant_reference': f'10000-{self.cart.id}'})
-        request = self.request_factory.post(self.url, data)
-        request.user = self.user
-        response = PayfortFeedbackView.as_view()(request)
-        assert response.status_code == 400
+        for merchant_reference in (f'{self.site.id}-10000', f'10000-{self.cart.id}'):
+            with self.subTest(merchant_reference=merchant_reference):
+                data = {**self.valid_response, 'merchant_reference': merchant_reference}
+                response = self.post_feedback(data)
+                assert response.status_code == 400
 
     def test_post_for_invalid_signature(self) -> None:
         """
@@ -158,28 +217,21 @@ class PayfortFeedbackTestView(TestCase):
 
         :return: None
         """
-        data = self.valid_response.copy()
-        request = self.request_factory.post(self.url, data)
-        request.user = self.user
-        assert not AuditLog.objects.filter(
-            action=AuditLog.AuditActions.BAD_RESPONSE_SIGNATURE,
-            cart=self.cart,
-            gateway='payfort'
-        ).exists(), 'AuditLog for BAD_RESPONSE_SIGNATURE with PayFort gateway should not existbefore fucntion call.'
+        self.mock_verify_signature.side_effect = verify_signature
+        data = self.valid_response
+
+        with patch('payfort.views.AuditLog.log') as mock_audit_log:
+            response = self.post_feedback(data)
 
-        response = PayfortFeedbackView.as_view()(request)
         assert response.status_code == 400
-        assert AuditLog.objects.filter(
+        mock_audit_log.assert_any_call(
             action=AuditLog.AuditActions.BAD_RESPONSE_SIGNATURE,
             cart=self.cart,
-            gateway='payfort'
-        ).exists(), 'AuditLog for BAD_RESPONSE_SIGNATURE with PayFort gateway and the given cart should exist'
+            gateway='payfort',
+            context={'data': data},
+        )
 
-    @pytest.mark.django_db
-    @patch('payfort.views.verify_signature')
-    def test_post_for_cart_not_in_processing_state(
-        self, mock_verify_signature  # pylint: disable=unused-argument
-    ) -> None:
+    def test_post_for_cart_not_in_processing_state(self) -> None:
         """
         Test that posting with a cart not in PROCESSING state raises PayFortException.
 
@@ -187,20 +239,44 @@ class PayfortFeedbackTestView(TestCase):
         """
         self.cart.status = Cart.Status.PENDING
         self.cart.save()
-        request = self.request_factory.post(self.url, self.valid_response)
-        request.user = self.user
-        assert not AuditLog.objects.filter(
+
+        with patch('payfort.views.AuditLog.log') as mock_audit_log:
+            response = self.post_feedback(self.valid_response)
+
+        mock_audit_log.assert_any_call(
+            action=AuditLog.AuditActions.RESPONSE_INVALID_CART,
+            cart=self.cart,
             gateway='payfort',
+            context={'cart_status': Cart.Status.PENDING, 'required_cart_state': Cart.Status.PROCESSING},
+        )
+        assert response.status_code == 200
+
+    def test_post_for_cart_paid_by_concurrent_feedback(self) -> None:
+        """
+        Test that the cart status is checked again on the locked row, not on the cart read before the lock.
+
+        :return: None
+        """
+        stale_cart = Cart.objects.get(pk=self.cart.pk)
+        Cart.objects.filter(pk=self.cart.pk).update(status=Cart.Status.PAID)
+
+        with patch.object(PayFort, 'get_cart', return_value=stale_cart), \
+                patch.object(PayFort, 'handle_payment') as mock_handle_payment, \
+                patch('payfort.views.AuditLog.log') as mock_audit_log:
+            response = self.post_feedback(self.valid_response)
+
+        mock_handle_payment.assert_not_called()
+        mock_audit_log.assert_any_call(
             action=AuditLog.AuditActions.RESPONSE_INVALID_CART,
-        ).exists()
-        response = PayfortFeedbackView.as_view()(request)
-        assert AuditLog.objects.filter(gateway='payfort', action=AuditLog.AuditActions.RESPONSE_INVALID_CART).exists()
+            cart=self.cart,
+            gateway='payfort',
+            context={'cart_status': Cart.Status.PAID, 'required_cart_state': Cart.Status.PROCESSING},
+        )
         assert response.status_code == 200
 
     @patch('payfort.views.logger')
-    @patch('payfort.views.verify_signature')
     def test_post_for_unsuccessful_payment(
-        self, mock_verify_signature, mock_logger  # pylint: disable=unused-argument
+        self, mock_logger
     ) -> None:
         """
         Test handling of unsuccessful payment status.
@@ -208,20 +284,28 @@ class PayfortFeedbackTestView(TestCase):
         :param mock_render: mocked render function
         :return: None
         """
-        data = self.valid_response.copy()
-        data.update({'status': '20'})
-        request = self.request_factory.post(self.url, data)
-        request.user = self.user
-        response = PayfortFeedbackView.as_view()(request)
-        mock_logger.warning.assert_called_with(
-            f'PayFort payment unsuccessful. Status: 20, Data: {data}'
-        )
+        data = {**self.valid_response, 'status': '20'}
+        response = self.post_feedback(data)
+        assert get_logged_message(mock_logger.warning) == f'PayFort payment unsuccessful. Status: 20, Data: {data}'
+        assert response.status_code == 200
+
+    @override_settings(PAYFORT_FAST_FAIL_UNVERIFIED=True)
+    @patch('payfort.views.logger')
+    def test_post_for_unsuccessful_payment_fast_fail(self, mock_logger) -> None:
+        """
+        Test that unsuccessful payments are acknowledged without signature verification when fast fail is enabled.
+
+        :return: None
+        """
+        data = {**self.valid_response, 'status': '20', 'signature': 'invalid'}
+        response = self.post_feedback(data)
+        self.mock_verify_signature.assert_not_called()
+        assert get_logged_message(mock_logger.warning) == f'PayFort payment unsuccessful. Status: 20, Data: {data}'
         assert response.status_code == 200
 
     @patch('payfort.views.logger.error')
-    @patch('payfort.views.verify_signature')
     def test_post_for_success_payment_enroll_error_no_course_mode(
-        self, mock_verify_signature, mock_logger  # pylint: disable=unused-argument
+        self, mock_logger
     ) -> None:
         """
         Test successful payment but course mode missing, triggers error logging and error page.
@@ -230,31 +314,26 @@ class PayfortFeedbackTestView(TestCase):
         :param mock_render: mocked render function
         :return: None
         """
-        assert not Transaction.objects.filter(gateway='payfort', cart=self.cart).exists(), \
+        assert self.payfort_transaction_count() == 0, \
             'Transaction should not exist before test'
         assert self.cart.status == Cart.Status.PROCESSING, \
             'Cart should be in PROCESSING state'
 
         self.course_mode.delete()
-        request = self.request_factory.post(self.url, self.valid_response)
-        request.user = self.user
-        response = PayfortFeedbackView.as_view()(request)
+        response = self.post_feedback(self.valid_response)
 
-        assert Transaction.objects.filter(gateway='payfort', cart=self.cart).exists(), \
+        assert self.payfort_transaction_count() == 1, \
             'Transaction should exist after payment'
-        self.cart.refresh_from_db()
+        self.cart.refresh_from_db(fields=['status'])
         assert self.cart.status == Cart.Status.PAID, \
             'Cart status should be PAID after successful payment'
 
-        mock_logger.assert_called_with(
+        assert get_logged_message(mock_logger) == (
             f'Failed to fulfill cart {self.cart.id} or to create invoice: CourseMode not found'
         )
         assert response.status_code == 200
 
-    @patch('payfort.views.verify_signature')
-    def test_post_success_for_rolled_back_of_tables_on_handle_payment_error(
-        self, mock_verify_signature  # pylint: disable=unused-argument
-    ) -> None:
+    def test_post_success_for_rolled_back_of_tables_on_handle_payment_error(self) -> None:
         """
         Test successful payment but course mode missing, triggers error logging and error page.
 
@@ -262,7 +341,7 @@ class PayfortFeedbackTestView(TestCase):
         :param mock_render: mocked render function
         :return: None
         """
-        assert not Transaction.objects.filter(gateway='payfort', cart=self.cart).exists(), \
+        assert self.payfort_transaction_count() == 0, \
             'Transaction should not exist before test'
         assert not WebhookEvent.objects.filter(
             gateway='payfort',
@@ -272,17 +351,14 @@ class PayfortFeedbackTestView(TestCase):
         assert self.cart.status == Cart.Status.PROCESSING, \
             'Cart should be in PROCESSING state'
 
-        request = self.request_factory.post(self.url, self.valid_response)
-        request.user = self.user
-
         with patch(
             'zeitlabs_payments.providers.base.WebhookEvent.objects.create',
             side_effect=Exception('Unknown exception')
         ):
 
-            response = PayfortFeedbackView.as_view()(request)
+            response = self.post_feedback(self.valid_response)
 
-            assert not Transaction.objects.filter(gateway='payfort', cart=self.cart).exists(), \
+            assert self.payfort_transaction_count() == 0, \
                 'Transaction should not exist after test'
             assert not WebhookEvent.objects.filter(
                 gateway='payfort',
@@ -293,17 +369,14 @@ class PayfortFeedbackTestView(TestCase):
                 'Cart should not be changed and should be in PROCESSING state'
             assert response.status_code == 200
 
-    @patch('payfort.views.verify_signature')
-    def test_post_success_for_duplicate_transaction(
-        self, mock_verify_signature  # pylint: disable=unused-argument
-    ) -> None:
+    def test_post_success_for_duplicate_transaction(self) -> None:
         """
         Test successful payment but transaction already there with transaction_id received in response.
         """
         Transaction.objects.create(
             gateway='payfort',
             cart=self.cart,
-            gateway_transaction_id=self.valid_response['fort_id'],
+            gateway_transaction_id=self.VALID_RESPONSE['fort_id'],
             amount=100
         )
 
@@ -315,9 +388,7 @@ class PayfortFeedbackTestView(TestCase):
         assert self.cart.status == Cart.Status.PROCESSING, \
             'Cart should be in PROCESSING state'
 
-        request = self.request_factory.post(self.url, self.valid_response)
-        request.user = self.user
-        response = PayfortFeedbackView.as_view()(request)
+        response = self.post_feedback(self.valid_response)
 
         assert AuditLog.objects.filter(
             action=AuditLog.AuditActions.DUPLICATE_TRANSACTION,
@@ -330,9 +401,8 @@ class PayfortFeedbackTestView(TestCase):
 
     @patch('payfort.views.logger.error')
     @patch('zeitlabs_payments.cart_handler.CourseEnrollment.enroll')
-    @patch('payfort.views.verify_signature')
     def test_post_for_success_payment_paid_course_with_unsuccessful_enrollment(
-        self, mock_verify_signature, mock_enroll, mock_logger  # pylint: disable=unused-argument
+        self, mock_enroll, mock_logger
     ) -> None:
         """
         Test payment success but enrollment fails, logs exception and shows error page.
@@ -343,38 +413,32 @@ class PayfortFeedbackTestView(TestCase):
         :return: None
         """
         mock_enroll.side_effect = Exception('Unexpected error during enrollment')
-        assert not Transaction.objects.filter(gateway='payfort', cart=self.cart).exists(), \
+        assert self.payfort_transaction_count() == 0, \
             'Transaction should not exist before test'
         assert self.cart.status == Cart.Status.PROCESSING, \
             'Cart should be in PROCESSING state'
 
-        request = self.request_factory.post(self.url, self.valid_response)
-        request.user = self.user
-        response = PayfortFeedbackView.as_view()(request)
+        response = self.post_feedback(self.valid_response)
 
-        assert Transaction.objects.filter(gateway='payfort', cart=self.cart).exists(), \
+        assert self.payfort_transaction_count() == 1, \
             'Transaction should exist after payment'
-        self.cart.refresh_from_db()
+        self.cart.refresh_from_db(fields=['status'])
         assert self.cart.status == Cart.Status.PAID, \
             'Cart status should be PAID after successful payment'
 
-        mock_logger.assert_called_with(
+        assert get_logged_message(mock_logger) == (
             f'Failed to fulfill cart {self.cart.id} or to create invoice: Unexpected error during enrollment'
         )
         assert response.status_code == 200
 
-    @pytest.mark.django_db
-    @patch('payfort.views.verify_signature')
-    def test_post_for_successful_payment(
-        self, mock_verify_signature  # pylint: disable=unused-argument
-    ) -> None:
+    def test_post_for_successful_payment(self) -> None:
         """
         Test the full successful payment flow and enrollment.
 
         :param mock_render: mocked render function
         :return: None
         """
-        assert not Transaction.objects.filter(gateway='payfort', cart=self.cart).exists(), \
+        assert self.payfort_transaction_count() == 0, \
             'Transaction should not exist before test'
         assert self.cart.status == Cart.Status.PROCESSING, \
             'Cart should be in PROCESSING state'
@@ -382,13 +446,11 @@ class PayfortFeedbackTestView(TestCase):
             user=self.cart.user, course=self.course_mode.course
         ).exists(), 'User should not be enrolled before test'
 
-        request = self.request_factory.post(self.url, self.valid_response)
-        request.user = self.user
-        response = PayfortFeedbackView.as_view()(request)
+        response = self.post_feedback(self.valid_response)
 
-        assert Transaction.objects.filter(gateway='payfort', cart=self.cart).exists(), \
+        assert self.payfort_transaction_count() == 1, \
             'Transaction should exist after payment'
-        self.cart.refresh_from_db()
+        self.cart.refresh_from_db(fields=['status'])
         assert self.cart.status == Cart.Status.PAID, \
             'Cart status should be PAID after payment'
         assert CourseEnrollment.objects.filter(
@@ -397,11 +459,9 @@ class PayfortFeedbackTestView(TestCase):
 
         assert response.status_code == 200
 
-    @pytest.mark.django_db
-    @patch('payfort.views.verify_signature')
     @patch('payfort.views.logger.error')
     def test_post_for_success_payment_cart_with_unsupported_item(
-        self, mock_logger, mock_verify_signature  # pylint: disable=unused-argument
+        self, mock_logger
     ) -> None:
         """
         Test successful payment but cart contains unsupported item, triggers error logging.
@@ -410,29 +470,26 @@ class PayfortFeedbackTestView(TestCase):
         :param mock_render: mocked render function
         :return: None
         """
-        assert not Transaction.objects.filter(gateway='payfort', cart=self.cart).exists(), \
+        assert self.payfort_transaction_count() == 0, \
             'Transaction should not exist before test'
         assert self.cart.status == Cart.Status.PROCESSING, \
             'Cart should be in PROCESSING state'
         unsupported_item = CatalogueItem.objects.create(sku='abcd', type='unsupported', price=50)
-        self.cart.items.all().delete()
-        self.cart.items.create(
+        self.cart.items.update(
             catalogue_item=unsupported_item,
             original_price=unsupported_item.price,
             final_price=unsupported_item.price,
         )
 
-        request = self.request_factory.post(self.url, self.valid_response)
-        request.user = self.user
-        response = PayfortFeedbackView.as_view()(request)
+        response = self.post_feedback(self.valid_response)
 
-        assert Transaction.objects.filter(gateway='payfort', cart=self.cart).exists(), \
+        assert self.payfort_transaction_count() == 1, \
             'Transaction should exist after payment'
-        self.cart.refresh_from_db()
+        self.cart.refresh_from_db(fields=['status'])
         assert self.cart.status == Cart.Status.PAID, \
             'Cart status should be PAID after payment'
 
-        mock_logger.assert_called_with(
+        assert get_logged_message(mock_logger) == (
             f'Failed to fulfill cart {self.cart.id} or to create invoice: Unsupported catalogue item type: unsupported'
         )
         assert response.status_code == 200
@@ -440,59 +497,70 @@ class PayfortFeedbackTestView(TestCase):
 
 @pytest.mark.django_db
 @pytest.mark.usefixtures('base_data')
-class PayFortStatusViewTest(APITestCase):
-    """Tests for PayFortStatusView"""
+class PayFortStatusViewValidationTest(APITestCase):
+    """Tests for PayFortStatusView requests rejected before any cart lookup"""
 
-    def setUp(self):
-        """Setup"""
-        self.user = User.objects.get(id=3)
-        self.cart = Cart.objects.create(user=self.user, status=Cart.Status.PROCESSING)
-        self.course_mode = CourseMode.objects.get(sku='custom-sku-1')
-        self.course_item = CatalogueItem.objects.get(sku='custom-sku-1')
-        self.cart.items.create(
-            catalogue_item=self.course_item,
-            original_price=self.course_item.price,
-            final_price=self.course_item.price,
-        )
-        self.site = Site.objects.create(name='test.com', domain='test.com')
-        self.url = reverse('payfort:status')
-
-    def login_user(self, user):
-        """Helper to login user"""
-        self.client.force_login(user)
+    @classmethod
+    def setUpTestData(cls):
+        """Setup data shared by all tests"""
+        cls.user = User.objects.get(id=3)
+        cls.url = reverse('payfort:status')
 
     def test_unauthorized(self):
         """Verify that the view returns 404 when the user is not authenticated"""
         response = self.client.get(self.url, data={})
         self.assertEqual(response.status_code, 400)
 
-    def test_get_failed_for_invalid_merchant_ref(self):
-        """Cart could not be found"""
-        self.login_user(self.user)
-        response = self.client.get(self.url, data={
-            'merchant_reference': '1111-2222',
-            'transaction_id': '1234'
-        })
-        assert response.status_code == 404
-        assert response.json()['error'] == 'merchant_reference: 1111-2222 is invalid. Unable to retrieve cart.'
-
     def test_get_failed_for_missing_merchant_ref(self):
         """Missing merchant reference"""
-        self.login_user(self.user)
+        self.client.force_login(self.user)
         response = self.client.get(self.url, data={'transaction_id': '1234'})
         assert response.status_code == 400
         assert response.json()['error'] == 'Merchant Reference is required to verify payment status.'
 
     def test_get_failed_for_missing_transaction_id(self):
         """Missing transaction_id"""
-        self.login_user(self.user)
+        self.client.force_login(self.user)
         response = self.client.get(self.url, data={'merchant_reference': '1-1'})
         assert response.status_code == 400
         assert response.json()['error'] == 'Transaction Id is required to verify payment status.'
 
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures('base_data')
+class PayFortStatusViewTest(APITestCase):
+    """Tests for PayFortStatusView"""
+
+    @classmethod
+    def setUpTestData(cls):
+        """Setup data shared by all tests"""
+        cls.user = User.objects.get(id=3)
+        cls.course_mode = CourseMode.objects.get(sku='custom-sku-1')
+        cls.course_item = CatalogueItem.objects.get(sku='custom-sku-1')
+        cls.site, _ = Site.objects.get_or_create(domain='test.com', defaults={'name': 'test.com'})
+        cls.url = reverse('payfort:status')
+        cls.cart = make_cart(cls.user, cls.course_item)
+        cls.merchant_reference = f'{cls.site.id}-{cls.cart.id}'
+
+        client = cls.client_class()
+        client.force_login(cls.user)
+        cls.session_key = client.cookies[settings.SESSION_COOKIE_NAME].value
+
+    def setUp(self):
+        """Reuse the logged in session for every test"""
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = self.session_key
+
+    def test_get_failed_for_invalid_merchant_ref(self):
+        """Cart could not be found"""
+        response = self.client.get(self.url, data={
+            'merchant_reference': '1111-2222',
+            'transaction_id': '1234'
+        })
+        assert response.status_code == 404
+        assert response.json()['error'] == 'merchant_reference: 1111-2222 is invalid. Unable to retrieve cart.'
+
     def test_paid_cart_with_invoice(self):
         """Cart is PAID and invoice exists"""
-        self.login_user(self.user)
         self.cart.status = Cart.Status.PAID
         self.cart.save()
 
@@ -511,11 +579,14 @@ class PayFortStatusViewTest(APITestCase):
             gross_total=self.course_item.price,
         )
 
-        response = self.client.get(self.url, data={
-            'merchant_reference': f'{self.site.id}-{self.cart.id}',
-            'transaction_id': 'tx123'
-        })
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, data={
+                'merchant_reference': self.merchant_reference,
+                'transaction_id': 'tx123'
+            })
         assert response.status_code == 200
+        tables = [connection.ops.quote_name(model._meta.db_table) for model in (Cart, Invoice)]
+        assert len([query for query in queries if any(table in query['sql'] for table in tables)]) == 1
         data = response.json()
         assert data['invoice'] == 'DEV-100'
         assert data['invoice_url'] == reverse(
@@ -525,32 +596,29 @@ class PayFortStatusViewTest(APITestCase):
 
     def test_paid_cart_without_invoice(self):
         """Cart is PAID but no invoice found"""
-        self.login_user(self.user)
         self.cart.status = Cart.Status.PAID
         self.cart.save()
 
         response = self.client.get(self.url, data={
-            'merchant_reference': f'{self.site.id}-{self.cart.id}',
+            'merchant_reference': self.merchant_reference,
             'transaction_id': 'does-npt-matter'
         })
         assert response.status_code == 204
 
     def test_processing_cart(self):
         """Cart in PROCESSING status"""
-        self.login_user(self.user)
         response = self.client.get(self.url, data={
-            'merchant_reference': f'{self.site.id}-{self.cart.id}',
+            'merchant_reference': self.merchant_reference,
             'transaction_id': 'does-npt-matter'
         })
         assert response.status_code == 204
 
     def test_unknown_cart_status(self):
         """Cart in unknown status"""
-        self.login_user(self.user)
         self.cart.status = 'UNKNOWN'
         self.cart.save()
         response = self.client.get(self.url, data={
-            'merchant_reference': f'{self.site.id}-{self.cart.id}',
+            'merchant_reference': self.merchant_reference,
             'transaction_id': 'does-not-matter'
         })
         assert response.status_code == 404
@@ -561,24 +629,24 @@ class PayFortStatusViewTest(APITestCase):
 class PayFortReturnViewTest(TestCase):
     """PayFortReturnView Tests."""
 
-    def setUp(self):
-        self.factory = RequestFactory()
-        self.user = User.objects.get(id=3)
-        self.cart = Cart.objects.create(user=self.user, status=Cart.Status.PROCESSING)
-        self.course_mode = CourseMode.objects.get(sku='custom-sku-1')
-        self.course_item = CatalogueItem.objects.get(sku='custom-sku-1')
-        self.cart.items.create(
-            catalogue_item=self.course_item,
-            original_price=self.course_item.price,
-            final_price=self.course_item.price,
-        )
-        self.site = Site.objects.create(name='test.com', domain='test.com')
-        self.client = Client()
+    MISSING_MERCHANT_REFERENCE_DATA = sign_response({'other': '1234'})
+    FAILED_STATUS_DATA = sign_response({'other': '1234', 'status': 'not-success', 'response_code': 11})
+    INVALID_FORMAT_DATA = sign_response({'other': '1234', 'status': '14', 'response_code': 14})
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.get(id=3)
+        cls.course_mode = CourseMode.objects.get(sku='custom-sku-1')
+        cls.course_item = CatalogueItem.objects.get(sku='custom-sku-1')
+        cls.site, _ = Site.objects.get_or_create(domain='test.com', defaults={'name': 'test.com'})
+        cls.url = reverse('payfort:return')
+        cls.cart = make_cart(cls.user, cls.course_item)
+        cls.merchant_reference = f'{cls.site.id}-{cls.cart.id}'
 
     def test_missing_signature(self):
         data = {
             'other': '1234',
-            'merchant_reference': f'{self.site.id}-{self.cart.id}',
+            'merchant_reference': self.merchant_reference,
         }
 
         assert not AuditLog.objects.filter(
@@ -587,7 +655,7 @@ class PayFortReturnViewTest(TestCase):
             gateway='payfort',
         ).exists()
 
-        response = self.client.post(reverse('payfort:return'), data)
+        response = self.client.post(self.url, data)
 
         assert response.status_code == 200
         assert AuditLog.objects.filter(
@@ -595,7 +663,8 @@ class PayFortReturnViewTest(TestCase):
             cart=self.cart,
             gateway='payfort',
             details=(
-                "Bad response signature detected: {'other': '1234', 'merchant_reference': '2-1'}."
+                "Bad response signature detected: "
+                f"{{'other': '1234', 'merchant_reference': '{self.merchant_reference}'}}."
             )
         ).exists()
         self.assertTemplateUsed(response, 'zeitlabs_payments/payment_error.html')
@@ -603,7 +672,7 @@ class PayFortReturnViewTest(TestCase):
     def test_bad_signature_renders_error_page(self):
         data = {
             'other': '1234',
-            'merchant_reference': f'{self.site.id}-{self.cart.id}',
+            'merchant_reference': self.merchant_reference,
             'signature': 'invalid'
         }
 
@@ -613,7 +682,7 @@ class PayFortReturnViewTest(TestCase):
             gateway='payfort',
         ).exists()
 
-        response = self.client.post(reverse('payfort:return'), data)
+        response = self.client.post(self.url, data)
 
         assert response.status_code == 200
         assert AuditLog.objects.filter(
@@ -621,74 +690,31 @@ class PayFortReturnViewTest(TestCase):
             cart=self.cart,
             gateway='payfort',
             details=(
-                "Bad response signature detected: {'other': '1234', 'merchant_reference': '2-1', "
-                "'signature': 'invalid'}."
+                "Bad response signature detected: "
+                f"{{'other': '1234', 'merchant_reference': '{self.merchant_reference}', 'signature': 'invalid'}}."
             )
         ).exists()
         self.assertTemplateUsed(response, 'zeitlabs_payments/payment_error.html')
 
     @patch('payfort.views.logger.error')
-    def test_missing_merchant_identifier(self, mock_error_log):
-        data = {'other': '1234'}
-
-        params_copy = data.copy()
-        sorted_keys = sorted(params_copy, key=lambda arg: arg.lower())
-        sorted_dict = {key: params_copy[key] for key in sorted_keys}
-        result_string = (
-            f"test-response-phrase{''.join(f'{key}={value}' for key, value in sorted_dict.items())}"
-            'test-response-phrase'
-        )
-        expected_signature = hashlib.sha256(result_string.encode()).hexdigest()
-
-        data.update({'signature': expected_signature})
-        response = self.client.post(reverse('payfort:return'), data)
-        mock_error_log.assert_called_with(
-            'Payfort payment failed! with merchant_reference: None, status: None and response_code: None'
-        )
-        self.assertTemplateUsed(response, 'zeitlabs_payments/payment_error.html')
-
-    @patch('payfort.views.logger.error')
-    def test_post_for_failed_status(self, mock_error_log):
-        data = {
-            'other': '1234',
-            'status': 'not-success',
-            'response_code': 11
-        }
-
-        params_copy = data.copy()
-        sorted_keys = sorted(params_copy, key=lambda arg: arg.lower())
-        sorted_dict = {key: params_copy[key] for key in sorted_keys}
-        result_string = (
-            f"test-response-phrase{''.join(f'{key}={value}' for key, value in sorted_dict.items())}"
-            'test-response-phrase'
-        )
-        expected_signature = hashlib.sha256(result_string.encode()).hexdigest()
-
-        data.update({'signature': expected_signature})
-        response = self.client.post(reverse('payfort:return'), data)
-        mock_error_log.assert_called_with(
-            'Payfort payment failed! with merchant_reference: None, status: not-success and response_code: 11'
-        )
-        self.assertTemplateUsed(response, 'zeitlabs_payments/payment_error.html')
+    def test_post_for_failed_payment(self, mock_error_log):
+        for data, expected_log in (
+            (
+                self.MISSING_MERCHANT_REFERENCE_DATA,
+                'Payfort payment failed! with merchant_reference: None, status: None and response_code: None',
+            ),
+            (
+                self.FAILED_STATUS_DATA,
+                'Payfort payment failed! with merchant_reference: None, status: not-success and response_code: 11',
+            ),
+        ):
+            with self.subTest(data=data):
+                response = self.client.post(self.url, data)
+                assert get_logged_message(mock_error_log) == expected_log
+                self.assertTemplateUsed(response, 'zeitlabs_payments/payment_error.html')
 
     def test_post_for_verify_format_failiure(self):
-        data = {
-            'other': '1234',
-            'status': '14',
-            'response_code': 14
-        }
-
-        params_copy = data.copy()
-        sorted_keys = sorted(params_copy, key=lambda arg: arg.lower())
-        sorted_dict = {key: params_copy[key] for key in sorted_keys}
-        result_string = (
-            f"test-response-phrase{''.join(f'{key}={value}' for key, value in sorted_dict.items())}"
-            'test-response-phrase'
-        )
-        expected_signature = hashlib.sha256(result_string.encode()).hexdigest()
-
-        data.update({'signature': expected_signature})
-        response = self.client.post(reverse('payfort:return'), data)
+        response = self.client.post(self.url, self.INVALID_FORMAT_DATA)
         self.assertTemplateUsed(response, 'zeitlabs_payments/payment_error.html')
 
     def test_post_success(self):
@@ -699,24 +725,14 @@ class PayFortReturnViewTest(TestCase):
             'fort_id': '123456',
             'command': 'PURCHASE',
             'response_message': 'Success',
-            'merchant_reference': f'{self.site.id}-{self.cart.id}',
+            'merchant_reference': self.merchant_reference,
             'currency': 'SAR',
             'status': '14',
             'eci': 'test'
         }
 
-        params_copy = data.copy()
-        sorted_keys = sorted(params_copy, key=lambda arg: arg.lower())
-        sorted_dict = {key: params_copy[key] for key in sorted_keys}
-        result_string = (
-            f"test-response-phrase{''.join(f'{key}={value}' for key, value in sorted_dict.items())}"
-            'test-response-phrase'
-        )
-        expected_signature = hashlib.sha256(result_string.encode()).hexdigest()
-
-        data.update({'signature': expected_signature})
-
-        response = self.client.post(reverse('payfort:return'), data)
+        data = sign_response(data)
+        response = self.client.post(self.url, data)
         self.assertTemplateUsed(response, 'zeitlabs_payments/wait_feedback.html')
         assert response.context['ecommerce_transaction_id'] == '123456'
         assert response.context['ecommerce_status_url'] == reverse('payfort:status')
@@ -730,5 +746,4 @@ class PayFortReturnViewTest(TestCase):
         )
         assert response.context['ecommerce_max_attempts'] == 24
         assert response.context['ecommerce_wait_time'] == 5000
-        for key, value in data.items():
-            assert response.context[key] == value
+        assert {key: response.context[key] for key in data} == data